@@ -5,10 +5,16 @@ import os
 import json
 import uuid
 import logging
+import threading
+from functools import partial
 from typing import List, Tuple, Optional
 
 import requests
-import psycopg
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+from psycopg.conninfo import make_conninfo
+from psycopg.types.json import Jsonb, set_json_dumps
+from psycopg_pool import ConnectionPool
 os.environ.setdefault("GRADIO_ANALYTICS_ENABLED", "0")
 os.environ.setdefault("GRADIO_ALLOWED_PATHS", "/app")
 
@@ -33,104 +39,191 @@ DB_CONN_INFO = {
     "password": os.getenv("POSTGRES_PASSWORD", "changeme"),
 }
 
+# Metadata is machine-read; send it to Postgres without pretty-printing.
+set_json_dumps(partial(json.dumps, separators=(",", ":")))
 
-def get_conn():
-    return psycopg.connect(**DB_CONN_INFO, autocommit=True)
+POOL = ConnectionPool(
+    conninfo=make_conninfo(**DB_CONN_INFO),
+    min_size=2,
+    max_size=10,
+    kwargs={"autocommit": True},
+    open=True,
+)
+
+# Recent per-session history, kept in step with what handle_chat persists so
+# a turn does not need to re-read the conversation from Postgres.
+HIST_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=600)
+HIST_CACHE_LOCK = threading.Lock()
+
+# Shared HTTP session so Ollama calls reuse keep-alive connections.
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 
 def init_db():
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS conversation_history (
-                    id BIGSERIAL PRIMARY KEY,
-                    session_id TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    metadata TEXT
-                );
-                """
-            )
-            cur.execute(
-                """
-                CREATE INDEX IF NOT EXISTS conversation_history_session_created_idx
-                ON conversation_history (session_id, created_at);
-                """
-            )
-            cur.execute(
-                "ALTER TABLE conversation_history ADD COLUMN IF NOT EXISTS metadata TEXT;"
-            )
+    with POOL.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_history (
+                id BIGSERIAL PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
+                content TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                metadata JSONB
+            );
+            """
+        )
+        # Matches fetch_history's ORDER BY so the newest rows come straight off
+        # the index. content still comes from the heap (btree entries are capped
+        # at ~2.7kB), so INCLUDEing other columns would only grow the index.
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS conversation_history_session_order_idx
+            ON conversation_history (session_id, created_at, id);
+            """
+        )
+        cur.execute("DROP INDEX IF EXISTS conversation_history_session_created_idx;")
+        cur.execute("DROP INDEX IF EXISTS conversation_history_session_created_id_idx;")
+        cur.execute(
+            "ALTER TABLE conversation_history ADD COLUMN IF NOT EXISTS metadata JSONB;"
+        )
+        # Older deployments stored metadata as pretty-printed TEXT; convert once.
+        cur.execute(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'conversation_history'
+                      AND column_name = 'metadata'
+                      AND data_type = 'text'
+                ) THEN
+                    ALTER TABLE conversation_history
+                    ALTER COLUMN metadata TYPE JSONB USING metadata::jsonb;
+                END IF;
+            END
+            $$;
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                first_user_message TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS sessions_created_idx
+            ON sessions (created_at);
+            """
+        )
+        # Backfill the summary table once for histories written before it existed.
+        cur.execute(
+            """
+            INSERT INTO sessions (session_id, first_user_message, created_at)
+            SELECT DISTINCT ON (session_id) session_id, content, created_at
+            FROM conversation_history
+            WHERE role = 'user'
+              AND NOT EXISTS (SELECT 1 FROM sessions)
+            ORDER BY session_id, created_at ASC, id ASC
+            ON CONFLICT (session_id) DO NOTHING
+            """
+        )
     logger.info("Database initialized")
 
 
-def append_message(session_id: str, role: str, content: str, metadata: dict) -> None:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
+def append_messages(session_id: str, items: List[Tuple[str, str, dict]]) -> None:
+    """Insert several (role, content, metadata) messages in one round-trip."""
+    with POOL.connection() as conn, conn.pipeline(), conn.transaction(), conn.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO conversation_history (session_id, role, content, metadata) VALUES (%s, %s, %s, %s)",
+            [
+                (session_id, role, content, Jsonb(metadata))
+                for role, content, metadata in items
+            ],
+        )
+        first_user = next((content for role, content, _ in items if role == "user"), None)
+        if first_user is not None:
             cur.execute(
-                "INSERT INTO conversation_history (session_id, role, content, metadata) VALUES (%s, %s, %s, %s)",
-                (session_id, role, content, json.dumps(metadata, indent=2)),
+                "INSERT INTO sessions (session_id, first_user_message) VALUES (%s, %s) ON CONFLICT (session_id) DO NOTHING",
+                (session_id, first_user),
             )
 
 
-def fetch_history(session_id: str) -> List[Tuple[str, str, dict]]:
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT role, content, metadata
-                FROM conversation_history
-                WHERE session_id = %s
-                ORDER BY created_at ASC
-                LIMIT %s
-                """,
-                (session_id, MAX_HISTORY_MESSAGES),
-            )
-            return cur.fetchall()
+def fetch_history(session_id: str) -> List[Tuple[str, str]]:
+    """Fetch the newest MAX_HISTORY_MESSAGES (role, content) rows, oldest first."""
+    with POOL.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT role, content
+            FROM conversation_history
+            WHERE session_id = %s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+            """,
+            (session_id, MAX_HISTORY_MESSAGES),
+        )
+        rows = cur.fetchall()
+    rows.reverse()
+    with HIST_CACHE_LOCK:
+        HIST_CACHE[session_id] = rows
+    return rows
+
+
+def get_cached_history(session_id: str) -> List[Tuple[str, str]]:
+    """Return the session history from the cache, falling back to Postgres."""
+    with HIST_CACHE_LOCK:
+        rows = HIST_CACHE.get(session_id)
+    if rows is None:
+        rows = fetch_history(session_id)
+    return rows
 
 
 def get_all_sessions() -> List[Tuple[str, str, str]]:
-    """Get all unique sessions with their first message and timestamp."""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT DISTINCT ON (session_id)
-                    session_id,
-                    content,
-                    created_at::text
-                FROM conversation_history
-                WHERE role = 'user'
-                ORDER BY session_id, created_at ASC
-                """
-            )
-            return cur.fetchall()
+    """Get the most recent sessions with their first message and timestamp."""
+    with POOL.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT session_id, first_user_message, created_at::text
+            FROM sessions
+            ORDER BY created_at DESC
+            LIMIT 200
+            """
+        )
+        return cur.fetchall()
 
 
 def delete_session(session_id: str) -> None:
     """Delete all messages from a specific session."""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "DELETE FROM conversation_history WHERE session_id = %s",
-                (session_id,)
-            )
+    with POOL.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM conversation_history WHERE session_id = %s",
+            (session_id,)
+        )
+        cur.execute("DELETE FROM sessions WHERE session_id = %s", (session_id,))
+    with HIST_CACHE_LOCK:
+        HIST_CACHE.pop(session_id, None)
     logger.info(f"Deleted session: {session_id}")
 
 
 def delete_all_sessions() -> None:
     """Delete all conversation history."""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM conversation_history")
+    with POOL.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM conversation_history")
+        cur.execute("DELETE FROM sessions")
+    with HIST_CACHE_LOCK:
+        HIST_CACHE.clear()
     logger.info("Deleted all sessions")
 
 
-def history_to_chat_pairs(rows: List[Tuple[str, str, dict]]) -> List[Tuple[str, str]]:
+def history_to_chat_pairs(rows: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
     pairs: List[Tuple[str, str]] = []
     current_user: Optional[str] = None
-    for role, content, _ in rows:
+    for role, content in rows:
         if role == "user":
             current_user = content
         elif role == "assistant":
@@ -141,51 +234,77 @@ def history_to_chat_pairs(rows: List[Tuple[str, str, dict]]) -> List[Tuple[str,
     return pairs
 
 
-def build_messages(rows: List[Tuple[str, str, dict]], user_message: str):
+def build_messages(rows: List[Tuple[str, str]], user_message: str):
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    for role, content, _ in rows:
+    for role, content in rows:
         messages.append({"role": role, "content": content})
     messages.append({"role": "user", "content": user_message})
     return messages
 
 
 def chat_with_ollama(messages):
+    """Stream the reply from Ollama, yielding (content_delta, metadata) per chunk."""
     url = f"{OLLAMA_BASE_URL.rstrip('/')}/api/chat"
     payload = {
         "model": OLLAMA_MODEL,
         "messages": messages,
-        "stream": False,
+        "stream": True,
     }
-    resp = requests.post(url, json=payload, timeout=180)
-    resp.raise_for_status()
-    data = resp.json()
-    reply = data.get("message", {}).get("content")
-    metadata = data.get("metadata", {})
-    if not reply:
-        raise RuntimeError("Empty response from Ollama")
-    return reply, metadata
+    with SESSION.post(url, json=payload, stream=True, timeout=180) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"])
+            yield chunk.get("message", {}).get("content", ""), chunk.get("metadata", {})
+
+
+_NO_UPDATE = gr.update()
 
 
 def handle_chat(user_message: str, history: List[Tuple[str, str]], session_id: str):
     if not user_message:
-        return history, gr.update(), session_id
+        yield history, _NO_UPDATE, session_id
+        return
 
-    stored_history = fetch_history(session_id)
+    stored_history = get_cached_history(session_id)
     messages = build_messages(stored_history, user_message)
 
-    append_message(session_id, "user", user_message, {})
-
+    assistant_reply = ""
+    metadata = {}
+    history.append((user_message, assistant_reply))
     try:
-        assistant_reply, metadata = chat_with_ollama(messages)
+        for delta, chunk_metadata in chat_with_ollama(messages):
+            assistant_reply += delta
+            metadata = chunk_metadata or metadata
+            history[-1] = (user_message, assistant_reply)
+            yield history, _NO_UPDATE, session_id
+        if not assistant_reply:
+            raise RuntimeError("Empty response from Ollama")
     except Exception as exc:
         logger.exception("Chat failed")
         assistant_reply = f"Error: {exc}"
         metadata = {}
 
-    append_message(session_id, "assistant", assistant_reply, metadata)
+    # Persist before the final frame: Gradio stops pulling the generator once
+    # the client disconnects, so anything after the last yield may never run.
+    turn = [("user", user_message, {}), ("assistant", assistant_reply, metadata)]
+    try:
+        append_messages(session_id, turn)
+    except Exception:
+        with HIST_CACHE_LOCK:
+            HIST_CACHE.pop(session_id, None)
+        raise
+    with HIST_CACHE_LOCK:
+        HIST_CACHE[session_id] = (
+            stored_history + [("user", user_message), ("assistant", assistant_reply)]
+        )[-MAX_HISTORY_MESSAGES:]
 
-    history = history + [(user_message, assistant_reply)]
-    return history, json.dumps(metadata, indent=2), session_id
+    history[-1] = (user_message, assistant_reply)
+    # Pretty-print only for the metadata textbox.
+    yield history, json.dumps(metadata, indent=2), session_id
 
 
 def load_history(session_id: str):
@@ -303,12 +422,15 @@ def main():
     demo = build_interface()
     port = int(os.getenv("PORT", os.getenv("OLLAMA_UI_PORT", "7861")))
     demo.queue()
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=port,
-        inbrowser=False,
-        share=False,
-    )
+    try:
+        demo.launch(
+            server_name="0.0.0.0",
+            server_port=port,
+            inbrowser=False,
+            share=False,
+        )
+    finally:
+        POOL.close()
 
 
 if __name__ == "__main__":
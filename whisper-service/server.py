@@ -4,36 +4,127 @@ Whisper HTTP API Server for Jetson
 Provides REST endpoints for speech-to-text using faster-whisper with GPU acceleration.
 """
 
+import asyncio
+import hashlib
 import os
-import tempfile
 import logging
-from typing import Optional
-from pathlib import Path
-
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import TYPE_CHECKING, BinaryIO, Optional, Union
+
+# CPU threading defaults for CTranslate2; they only affect the CPU path
+# (WHISPER_DEVICE=cpu), not GPU inference. Must be set before CTranslate2
+# loads; anything already present in the environment wins.
+os.environ.setdefault("OMP_NUM_THREADS", "4")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("CT2_USE_EXPERIMENTAL_PACKED_GEMM", "1")
+
+import anyio
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+import orjson
 import uvicorn
-import gradio as gr
-from gradio.routes import mount_gradio_app
+from cachetools import TTLCache
+
+if TYPE_CHECKING:
+    import numpy
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Spooled uploads that outgrow memory (ours and Starlette's multipart files)
+# land in tempfile's directory; keep them on tmpfs rather than eMMC
+TMPDIR = os.environ.get("WHISPER_TMPDIR", "/dev/shm")
+# Gradio keeps every UI upload under tempfile's directory and never cleans
+# it up; pin its cache to the on-disk default so it cannot fill the tmpfs
+os.environ.setdefault("GRADIO_TEMP_DIR", os.path.join(tempfile.gettempdir(), "gradio"))
+if os.path.isdir(TMPDIR):
+    tempfile.tempdir = TMPDIR
+else:
+    logger.warning(f"WHISPER_TMPDIR {TMPDIR} does not exist; using {tempfile.gettempdir()}")
+
 app = FastAPI(
     title="Whisper ASR API",
     description="Speech-to-Text API using faster-whisper on Jetson",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Global model instance
+# Global model instances; loaders run in worker threads, so the locks keep
+# concurrent first requests from each loading their own copy
 model = None
+batched_model = None
+MODEL_LOCK = threading.Lock()
+BATCHED_MODEL_LOCK = threading.Lock()
 MODEL_SIZE = os.environ.get("WHISPER_MODEL", "base")
 DEVICE = os.environ.get("WHISPER_DEVICE", "cuda")
-COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "float16")
+# int8_float16 keeps INT8 weights (half the memory of float16) on Jetson GPUs
+COMPUTE_TYPE = os.environ.get(
+    "WHISPER_COMPUTE_TYPE",
+    "int8_float16" if DEVICE == "cuda" else "int8"
+)
+# CTranslate2 workers share one copy of the weights; each can run a
+# transcription concurrently with its own decoder state
+NUM_WORKERS = int(os.environ.get("WHISPER_NUM_WORKERS", "2"))
+# Greedy decoding by default; temperature fallback re-decodes only hard segments
+BEAM_SIZE = int(os.environ.get("WHISPER_BEAM_SIZE", "1"))
+# Wider beams multiply decoder memory; cap per-request values so one call
+# cannot exhaust the GPU memory shared with the rest of the device
+MAX_BEAM_SIZE = 10
+TEMPERATURE = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+# Silero VAD skips silence before it reaches the encoder; disable for
+# forced-alignment style use where every frame must be decoded
+VAD_FILTER = os.environ.get("WHISPER_VAD", "1") == "1"
+VAD_PARAMETERS = {"min_silence_duration_ms": 500}
+SAMPLE_RATE = 16000
+# Keep decoded samples as float16: half the memory while requests wait for
+# the GPU. They are widened back to float32 before inference.
+AUDIO_FP16 = os.environ.get("WHISPER_AUDIO_FP16", "0") == "1"
+ENABLE_GRADIO_UI = os.environ.get("ENABLE_GRADIO_UI", "1") == "1"
+BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "16"))
+# Audio shorter than one Whisper window gains nothing from batching
+BATCH_MIN_SECONDS = 30
+# How long a batched forward pass waits for chunks from other requests
+# running at the same time; 0 disables cross-request batching
+BATCH_WINDOW = float(os.environ.get("WHISPER_BATCH_WINDOW_MS", "30")) / 1000
+HASH_CHUNK_SIZE = 1 << 20
+UPLOAD_SPOOL_SIZE = 8 << 20
+
+# Results keyed by (audio digest, language, task, word_timestamps, beam_size)
+# so replayed clips (e.g. n8n test runs) skip the GPU entirely
+ASR_CACHE = TTLCache(maxsize=512, ttl=3600)
+
+# Transcriptions currently running, keyed like ASR_CACHE
+INFLIGHT = {}
+
+# Only inference is gated; uploads and decoding still run concurrently. The
+# default matches NUM_WORKERS, the number of transcriptions one model instance
+# can run at once, so extra requests queue here instead of inside CTranslate2
+GPU_SEM = asyncio.Semaphore(int(os.environ.get("WHISPER_CONCURRENCY", str(NUM_WORKERS))))
+
+# Forward passes waiting for other requests' chunks, keyed by the decode
+# settings they must share; guarded by FORWARD_LOCK
+FORWARD_PENDING = {}
+FORWARD_LOCK = threading.Lock()
+# Transcriptions currently decoding through the batched pipeline
+ACTIVE_BATCHED = 0
+
+
+class _ForwardGroup:
+    """Chunks from several requests that will share one forward pass."""
+
+    def __init__(self):
+        self.calls = []
+        self.size = 0
+        self.full = threading.Event()
 
 
 class TranscriptionResponse(BaseModel):
+    """Response shape of /asr; used for the OpenAPI docs only."""
     text: str
     language: Optional[str] = None
     duration: Optional[float] = None
@@ -44,24 +135,134 @@ def get_model():
     """Lazy load the whisper model."""
     global model
     if model is None:
-        from faster_whisper import WhisperModel
-        logger.info(f"Loading Whisper model: {MODEL_SIZE} on {DEVICE} with {COMPUTE_TYPE}")
-        model = WhisperModel(
-            MODEL_SIZE,
-            device=DEVICE,
-            compute_type=COMPUTE_TYPE
-        )
-        logger.info("Model loaded successfully")
+        with MODEL_LOCK:
+            if model is None:
+                from faster_whisper import WhisperModel
+                logger.info(f"Loading Whisper model: {MODEL_SIZE} on {DEVICE} with {COMPUTE_TYPE}")
+                model = WhisperModel(
+                    MODEL_SIZE,
+                    device=DEVICE,
+                    compute_type=COMPUTE_TYPE,
+                    num_workers=NUM_WORKERS
+                )
+                logger.info("Model loaded successfully")
     return model
 
 
+def get_batched_model():
+    """Lazy wrap the model in a BatchedInferencePipeline, if available."""
+    global batched_model
+    if batched_model is None:
+        with BATCHED_MODEL_LOCK:
+            if batched_model is None:
+                try:
+                    from faster_whisper import BatchedInferencePipeline
+                except ImportError:
+                    logger.warning("faster-whisper has no BatchedInferencePipeline; batching disabled")
+                    batched_model = False
+                else:
+                    batched_model = BatchedInferencePipeline(model=get_model())
+                    # _batched_segments_generator calls self.forward, so every
+                    # request's chunk batches go through the cross-request batcher
+                    batched_model.forward = partial(_forward_together, batched_model.forward)
+    return batched_model or None
+
+
+def _forward_together(forward, features, tokenizer, chunks_metadata, options):
+    """Run one request's chunk batch in a shared forward pass with others'."""
+    # Word alignment carries pipeline state from one batch to the next, so
+    # those requests keep their batches to themselves
+    if options.word_timestamps or BATCH_WINDOW <= 0:
+        return forward(features, tokenizer, chunks_metadata, options)
+    
+    # Everything else in options is fixed server-side
+    key = (tokenizer.language_code, tokenizer.task, options.beam_size)
+    future = Future()
+    with FORWARD_LOCK:
+        group = FORWARD_PENDING.get(key)
+        leader = group is None or group.size + len(chunks_metadata) > BATCH_SIZE
+        if leader:
+            group = FORWARD_PENDING[key] = _ForwardGroup()
+        group.calls.append((features, chunks_metadata, future))
+        group.size += len(chunks_metadata)
+        if group.size >= BATCH_SIZE:
+            group.full.set()
+        # A lone transcription has nobody to wait for
+        wait = leader and ACTIVE_BATCHED > 1
+    if not leader:
+        return future.result()
+    
+    if wait:
+        group.full.wait(BATCH_WINDOW)
+    with FORWARD_LOCK:
+        if FORWARD_PENDING.get(key) is group:
+            del FORWARD_PENDING[key]
+    calls = group.calls
+    if len(calls) == 1:
+        return forward(features, tokenizer, chunks_metadata, options)
+    
+    import numpy as np
+    try:
+        outputs = forward(
+            np.concatenate([call_features for call_features, _, _ in calls]),
+            tokenizer,
+            [chunk for _, call_chunks, _ in calls for chunk in call_chunks],
+            options
+        )
+    except Exception as e:
+        for _, _, call_future in calls[1:]:
+            call_future.set_exception(e)
+        raise
+    # forward returns one entry per chunk, in input order
+    start = 0
+    for _, call_chunks, call_future in calls:
+        call_future.set_result(outputs[start:start + len(call_chunks)])
+        start += len(call_chunks)
+    logger.info(f"Batched {start} chunks from {len(calls)} requests in one forward pass")
+    return future.result()
+
+
+def _set_batched_active(delta: int) -> None:
+    global ACTIVE_BATCHED
+    with FORWARD_LOCK:
+        ACTIVE_BATCHED += delta
+
+
+def _release_batched(segments):
+    """Yield segments, then stop counting the transcription as active."""
+    try:
+        yield from segments
+    finally:
+        _set_batched_active(-1)
+
+
+def warmup_model(whisper_model):
+    """Run one second of silence through the model so CUDA kernels are ready."""
+    import numpy as np
+    started = time.perf_counter()
+    segments, _ = whisper_model.transcribe(
+        np.zeros(SAMPLE_RATE, dtype=np.float32),
+        language="en",
+        beam_size=BEAM_SIZE
+    )
+    # transcribe() is lazy; decoding only happens while iterating segments.
+    for _ in segments:
+        pass
+    logger.info(f"Model warm-up finished in {time.perf_counter() - started:.2f}s")
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Pre-load model on startup."""
+    """Pre-load and warm up the model on startup."""
     try:
-        get_model()
+        whisper_model = get_model()
     except Exception as e:
         logger.error(f"Failed to load model on startup: {e}")
+        return
+    try:
+        warmup_model(whisper_model)
+    except Exception as e:
+        logger.warning(f"Model warm-up failed: {e}")
 
 
 @app.get("/")
@@ -76,34 +277,289 @@ async def health():
     return {"status": "healthy"}
 
 
-def run_transcription_from_path(
-    file_path: str,
+def decode_audio(audio: Union[str, BinaryIO]):
+    """Decode audio to the 16 kHz mono float32 array the model consumes."""
+    from faster_whisper.audio import decode_audio as _decode_audio
+    samples = _decode_audio(audio, sampling_rate=SAMPLE_RATE)
+    if AUDIO_FP16:
+        samples = samples.astype("float16")
+    return samples
+
+
+def start_transcription(
+    audio: Union[str, BinaryIO, "numpy.ndarray"],
     language: Optional[str] = None,
     task: str = "transcribe",
-    word_timestamps: bool = False
+    word_timestamps: bool = False,
+    beam_size: int = BEAM_SIZE
 ):
-    """Run transcription using an existing file path."""
-    whisper_model = get_model()
-    segments, info = whisper_model.transcribe(
-        file_path,
+    """Start a transcription; returns the lazy segment generator and info."""
+    if getattr(audio, "dtype", None) == "float16":
+        # Silero VAD and the feature extractor only accept float32
+        audio = audio.astype("float32")
+    batched = None
+    # Only decoded arrays have a known length up front
+    duration = len(audio) / SAMPLE_RATE if getattr(audio, "ndim", 0) == 1 else 0
+    # Batches of one file are formed from VAD segments, so need the VAD filter
+    long_audio = VAD_FILTER and duration >= BATCH_MIN_SECONDS
+    # Short clips with a known language can share forward passes with other
+    # requests; without VAD the pipeline only handles a single window
+    shareable = (
+        BATCH_WINDOW > 0 and duration and language and not word_timestamps
+        and (VAD_FILTER or duration < BATCH_MIN_SECONDS)
+    )
+    if long_audio or shareable:
+        batched = get_batched_model()
+    
+    if batched is not None:
+        # VAD-split chunks of the file are decoded together in one batch,
+        # alongside chunks of other requests running at the same time.
+        # Counted from before VAD and feature extraction so a request that
+        # is still preparing its chunks is worth waiting for.
+        _set_batched_active(1)
+        try:
+            segments, info = batched.transcribe(
+                audio,
+                language=language,
+                task=task,
+                word_timestamps=word_timestamps,
+                batch_size=BATCH_SIZE,
+                beam_size=beam_size,
+                temperature=TEMPERATURE,
+                vad_filter=VAD_FILTER,
+                vad_parameters=VAD_PARAMETERS
+            )
+        except BaseException:
+            _set_batched_active(-1)
+            raise
+        # Callers always iterate the segments, which releases the count
+        segments = _release_batched(segments)
+    else:
+        segments, info = get_model().transcribe(
+            audio,
+            language=language,
+            task=task,
+            word_timestamps=word_timestamps,
+            beam_size=beam_size,
+            temperature=TEMPERATURE,
+            vad_filter=VAD_FILTER,
+            vad_parameters=VAD_PARAMETERS
+        )
+    return segments, info
+
+
+def segment_to_dict(segment) -> dict:
+    """Convert a faster-whisper segment to the API's segment shape."""
+    return {
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text.strip()
+    }
+
+
+def run_transcription(
+    audio: Union[str, BinaryIO, "numpy.ndarray"],
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    word_timestamps: bool = False,
+    beam_size: int = BEAM_SIZE
+):
+    """Run transcription on a file path, audio file object or decoded array."""
+    segments, info = start_transcription(
+        audio,
         language=language,
         task=task,
         word_timestamps=word_timestamps,
-        beam_size=5
+        beam_size=beam_size
     )
+    segment_list = [segment_to_dict(segment) for segment in segments]
+    text = " ".join(s["text"] for s in segment_list)
+    return text, info, segment_list
+
+
+def _hash_file(audio: BinaryIO, hasher) -> int:
+    """Feed a file object through hasher in chunks; return its size and rewind."""
+    audio.seek(0)
+    while chunk := audio.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    size = audio.tell()
+    audio.seek(0)
+    return size
+
+
+def _is_multipart(request: Request) -> bool:
+    return "multipart/form-data" in request.headers.get("content-type", "")
+
+
+async def _read_upload(request: Request, audio_file: Optional[UploadFile], digest: bool = True):
+    """Return the uploaded audio as a file object plus its digest (None if not requested)."""
+    hasher = hashlib.blake2b(digest_size=16) if digest else None
     
-    segment_list = []
-    full_text = []
-    for segment in segments:
-        segment_list.append({
-            "start": segment.start,
-            "end": segment.end,
-            "text": segment.text.strip()
-        })
-        full_text.append(segment.text.strip())
+    if _is_multipart(request):
+        # Standard multipart upload; Starlette has already spooled the
+        # file, so hand its file object straight to the decoder.
+        if audio_file is None:
+            raise HTTPException(status_code=400, detail="audio_file is required for multipart uploads")
+        audio = audio_file.file
+        if hasher is not None:
+            # Large uploads are spooled to disk; hash them off the event loop
+            size = await asyncio.to_thread(_hash_file, audio, hasher)
+        else:
+            size = audio.seek(0, os.SEEK_END)
+            audio.seek(0)
+    else:
+        # Raw binary upload (n8n compatibility); spool to disk past
+        # UPLOAD_SPOOL_SIZE so large bodies do not sit in RAM
+        audio = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+        async for chunk in request.stream():
+            audio.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+        size = audio.tell()
+        audio.seek(0)
     
-    text = " ".join(full_text)
-    return text, info, segment_list
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty audio data")
+    return audio, hasher.digest() if hasher is not None else None
+
+
+def _query_options(
+    request: Request,
+    language: Optional[str],
+    task: str,
+    word_timestamps: bool,
+    beam_size: Optional[int]
+):
+    """Read transcription options from the query string of a raw upload."""
+    query_params = request.query_params
+    language = query_params.get("language", language)
+    task = query_params.get("task", task)
+    word_timestamps = query_params.get("word_timestamps", "false").lower() == "true"
+    if "beam_size" in query_params:
+        try:
+            beam_size = int(query_params["beam_size"])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="beam_size must be an integer")
+    return language, task, word_timestamps, beam_size
+
+
+def _resolve_beam_size(beam_size: Optional[int]) -> int:
+    """Apply the default beam size and reject widths outside 1..MAX_BEAM_SIZE."""
+    if beam_size is None:
+        return BEAM_SIZE
+    if not 1 <= beam_size <= MAX_BEAM_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"beam_size must be between 1 and {MAX_BEAM_SIZE}"
+        )
+    return beam_size
+
+
+async def _stream_segments(
+    samples,
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    word_timestamps: bool = False,
+    beam_size: int = BEAM_SIZE
+):
+    """Yield NDJSON lines for each segment as the model produces it."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+    
+    def produce():
+        # Runs in a worker thread; pulling the generator drives the decoder
+        try:
+            segments, _ = start_transcription(
+                samples,
+                language=language,
+                task=task,
+                word_timestamps=word_timestamps,
+                beam_size=beam_size
+            )
+            for segment in segments:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, segment_to_dict(segment))
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+    
+    await GPU_SEM.acquire()
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    # Free the GPU slot as soon as the worker thread finishes, not when a
+    # slow client has read the last line; the rest drains from the queue
+    producer.add_done_callback(lambda _: GPU_SEM.release())
+    try:
+        while (item := await queue.get()) is not done:
+            if isinstance(item, Exception):
+                # Tell the client the transcript is incomplete
+                logger.error(f"Streaming transcription error: {item}")
+                yield orjson.dumps({"error": str(item)}) + b"\n"
+                break
+            yield orjson.dumps(item) + b"\n"
+    finally:
+        # Stop decoding if the client went away
+        stop.set()
+        with anyio.CancelScope(shield=True):
+            await producer
+
+
+async def _transcribe_audio(
+    cache_key: tuple,
+    audio: BinaryIO,
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    word_timestamps: bool = False,
+    beam_size: int = BEAM_SIZE
+):
+    """Decode and transcribe an upload, storing the result in ASR_CACHE."""
+    # Decoding and inference block, so keep them off the event loop. Decode
+    # separately so CPU-side decoding overlaps with other requests' GPU work.
+    samples = await asyncio.to_thread(decode_audio, audio)
+    # The encoded upload is no longer needed; free it before queueing for the GPU
+    audio.close()
+    async with GPU_SEM:
+        result = await asyncio.to_thread(
+            run_transcription,
+            samples,
+            language=language,
+            task=task,
+            word_timestamps=word_timestamps,
+            beam_size=beam_size
+        )
+    ASR_CACHE[cache_key] = result
+    return result
+
+
+async def _cached_transcription(
+    cache_key: tuple,
+    audio: BinaryIO,
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    word_timestamps: bool = False,
+    beam_size: int = BEAM_SIZE
+):
+    """Return a cached result, join an identical running one, or start one."""
+    result = ASR_CACHE.get(cache_key)
+    if result is not None:
+        return result
+    # Identical uploads arriving together share one transcription
+    pending = INFLIGHT.get(cache_key)
+    if pending is None:
+        pending = asyncio.ensure_future(_transcribe_audio(
+            cache_key,
+            audio,
+            language=language,
+            task=task,
+            word_timestamps=word_timestamps,
+            beam_size=beam_size
+        ))
+        INFLIGHT[cache_key] = pending
+        pending.add_done_callback(lambda _: INFLIGHT.pop(cache_key, None))
+    # Shield so one client disconnecting does not cancel the others
+    return await asyncio.shield(pending)
 
 
 async def _process_transcription(
@@ -112,59 +568,43 @@ async def _process_transcription(
     language: Optional[str] = None,
     task: str = "transcribe",
     output: str = "json",
-    word_timestamps: bool = False
+    word_timestamps: bool = False,
+    beam_size: Optional[int] = None
 ):
     """Internal transcription processing function."""
     try:
-        # Detect content type and handle accordingly
-        content_type = request.headers.get("content-type", "")
+        audio, digest = await _read_upload(request, audio_file)
+        if not _is_multipart(request):
+            # Raw binary uploads carry their options as query params
+            language, task, word_timestamps, beam_size = _query_options(
+                request, language, task, word_timestamps, beam_size
+            )
+            output = request.query_params.get("output", output)
         
-        if "multipart/form-data" in content_type:
-            # Standard multipart upload
-            if audio_file is None:
-                raise HTTPException(status_code=400, detail="audio_file is required for multipart uploads")
-            suffix = Path(audio_file.filename).suffix if audio_file.filename else ".wav"
-            content = await audio_file.read()
-        else:
-            # Raw binary upload (n8n compatibility)
-            content = await request.body()
-            if not content:
-                raise HTTPException(status_code=400, detail="Empty audio data")
-            # Parse query params for options
-            query_params = dict(request.query_params)
-            language = query_params.get("language", language)
-            task = query_params.get("task", task)
-            output = query_params.get("output", output)
-            word_timestamps = query_params.get("word_timestamps", "false").lower() == "true"
-            suffix = ".wav"
+        beam_size = _resolve_beam_size(beam_size)
+        cache_key = (digest, language, task, word_timestamps, beam_size)
+        text, info, segment_list = await _cached_transcription(
+            cache_key,
+            audio,
+            language=language,
+            task=task,
+            word_timestamps=word_timestamps,
+            beam_size=beam_size
+        )
         
-        # Save to temp location
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
+        if output == "text":
+            return ORJSONResponse({"text": text})
         
-        try:
-            text, info, segment_list = run_transcription_from_path(
-                tmp_path,
-                language=language,
-                task=task,
-                word_timestamps=word_timestamps
-            )
-            
-            if output == "text":
-                return JSONResponse(content={"text": text})
-            
-            return TranscriptionResponse(
-                text=text,
-                language=info.language,
-                duration=info.duration,
-                segments=segment_list
-            )
-            
-        finally:
-            # Cleanup temp file
-            os.unlink(tmp_path)
+        # Server-built output; skip Pydantic validation and encode directly
+        return ORJSONResponse({
+            "text": text,
+            "language": info.language,
+            "duration": info.duration,
+            "segments": segment_list
+        })
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -172,21 +612,30 @@ async def _process_transcription(
 
 def build_gradio_app():
     """Create Gradio UI for Whisper."""
+    import gradio as gr
+
     language_choices = [
         "",
         "en", "es", "fr", "de", "it", "pt", "zh", "ja", "ko", "hi", "ar"
     ]
 
-    def gradio_transcribe(audio, language, task, word_timestamps):
+    async def gradio_transcribe(audio, language, task, word_timestamps):
+        # Async so UI requests share GPU_SEM, ASR_CACHE and INFLIGHT with the API
         if not audio:
             return "Please provide audio.", {}
         lang = language or None
-        text, info, segments = run_transcription_from_path(
-            audio,
-            language=lang,
-            task=task,
-            word_timestamps=word_timestamps
-        )
+        # Repeated clicks on the same recording are served from ASR_CACHE
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(audio, "rb") as f:
+            await asyncio.to_thread(_hash_file, f, hasher)
+            cache_key = (hasher.digest(), lang, task, word_timestamps, BEAM_SIZE)
+            text, info, segments = await _cached_transcription(
+                cache_key,
+                f,
+                language=lang,
+                task=task,
+                word_timestamps=word_timestamps
+            )
         metadata = {
             "language": info.language,
             "duration": info.duration,
@@ -240,14 +689,15 @@ def build_gradio_app():
     return demo
 
 
-@app.post("/asr", response_model=TranscriptionResponse)
+@app.post("/asr", responses={200: {"model": TranscriptionResponse}})
 async def transcribe(
     request: Request,
     audio_file: Optional[UploadFile] = File(None),
     language: Optional[str] = Form(None),
     task: Optional[str] = Form("transcribe"),
     output: Optional[str] = Form("json"),
-    word_timestamps: Optional[bool] = Form(False)
+    word_timestamps: Optional[bool] = Form(False),
+    beam_size: Optional[int] = Form(None)
 ):
     """
     Transcribe audio file to text.
@@ -258,9 +708,10 @@ async def transcribe(
     - **task**: 'transcribe' or 'translate' (translate to English)
     - **output**: Output format ('json', 'text')
     - **word_timestamps**: Include word-level timestamps
+    - **beam_size**: Decoder beam width (default WHISPER_BEAM_SIZE, 1 = greedy, max 10)
     
     For n8n binary uploads, send raw audio as application/octet-stream.
-    Query params: ?language=en&task=transcribe&output=json
+    Query params: ?language=en&task=transcribe&output=json&beam_size=1
     """
     return await _process_transcription(
         request=request,
@@ -268,7 +719,50 @@ async def transcribe(
         language=language,
         task=task,
         output=output,
-        word_timestamps=word_timestamps
+        word_timestamps=word_timestamps,
+        beam_size=beam_size
+    )
+
+
+@app.post("/asr/stream")
+async def transcribe_stream(
+    request: Request,
+    audio_file: Optional[UploadFile] = File(None),
+    language: Optional[str] = Form(None),
+    task: Optional[str] = Form("transcribe"),
+    word_timestamps: Optional[bool] = Form(False),
+    beam_size: Optional[int] = Form(None)
+):
+    """
+    Transcribe audio and stream segments as NDJSON while they are decoded.
+    Takes the same inputs as /asr; each line is {"start", "end", "text"}.
+    """
+    try:
+        # Streamed results are not cached, so skip hashing the upload
+        audio, _ = await _read_upload(request, audio_file, digest=False)
+        if not _is_multipart(request):
+            language, task, word_timestamps, beam_size = _query_options(
+                request, language, task, word_timestamps, beam_size
+            )
+        beam_size = _resolve_beam_size(beam_size)
+        # Decode before the response starts so bad audio still gets a 500
+        samples = await asyncio.to_thread(decode_audio, audio)
+        audio.close()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Transcription error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        _stream_segments(
+            samples,
+            language=language,
+            task=task,
+            word_timestamps=word_timestamps,
+            beam_size=beam_size
+        ),
+        media_type="application/x-ndjson"
     )
 
 
@@ -294,11 +788,29 @@ async def openai_compatible_transcribe(
         word_timestamps=False
     )
 
-# Mount Gradio UI at /ui
-gradio_app = build_gradio_app()
-app = mount_gradio_app(app, gradio_app, path="/ui")
+# Mount Gradio UI at /ui only when enabled; building it costs startup time
+# and memory that API-only deployments do not need
+if ENABLE_GRADIO_UI:
+    from gradio.routes import mount_gradio_app
+    gradio_app = build_gradio_app()
+    app = mount_gradio_app(app, gradio_app, path="/ui")
+else:
+    @app.get("/ui")
+    async def gradio_disabled():
+        """Placeholder while the Gradio UI is disabled."""
+        raise HTTPException(status_code=404, detail="Gradio UI is disabled; set ENABLE_GRADIO_UI=1")
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 9000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WHISPER_WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+    # Each worker loads its own copy of the model; multiple workers need an
+    # import string so uvicorn can spawn them.
+    uvicorn.run(
+        "server:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )